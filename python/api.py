@@ -3,15 +3,43 @@
 Enhanced API for Cancer Classification with CSV Comparison
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
 from typing import Dict, Any, Optional
+import asyncio
+import math
 import tempfile
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+import numpy as np
 from model_service import get_model_service
 
-app = FastAPI(title="Cancer Classification API", version="2.0.0")
+def api_workers() -> int:
+    """Number of uvicorn worker processes serving the API (API_WORKERS, default 1)"""
+    return max(1, int(os.environ.get("API_WORKERS", 1)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load all models and start the inference thread pool once per worker, and release the pool on shutdown"""
+    # Load models up front so no request pays the cold start
+    app.state.service = get_model_service()
+    # Split the cores across worker processes so N workers don't run N x cpu_count threads
+    max_workers = max(1, (os.cpu_count() or 1) // api_workers())
+    app.state.executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        yield
+    finally:
+        # Wait for in-flight inference before the worker exits
+        app.state.executor.shutdown(wait=True)
+
+app = FastAPI(title="Cancer Classification API", version="2.0.0", default_response_class=ORJSONResponse,
+              lifespan=lifespan)
+# Routes that return model-service results wrap them in ORJSONResponse themselves: a returned
+# Response skips FastAPI's pydantic/jsonable_encoder pass, which rejects NumPy arrays
 
 # CORS middleware
 app.add_middleware(
@@ -22,15 +50,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def svc(request: Request):
+    """FastAPI dependency returning the preloaded model service"""
+    # async so FastAPI resolves it on the event loop instead of hopping through the thread pool
+    return request.app.state.service
+
 # Pydantic models
 class PredictInput(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
     dataset: str
     features: Dict[str, float]
 
 class BatchPredictInput(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
     dataset: str
     rows: list
 
+# Set-bit count for every byte value, used to popcount packed model votes
+POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def compute_consensus(pred_matrix: np.ndarray, prob_matrix: np.ndarray):
+    """Majority vote, mean confidence and agreement for (B, M) prediction/probability matrices"""
+    n_models = pred_matrix.shape[1]
+    if n_models == 0:
+        n_rows = pred_matrix.shape[0]
+        return np.zeros(n_rows, dtype=np.int8), np.zeros(n_rows, dtype=np.float64), np.zeros(n_rows, dtype=bool)
+
+    # Pack each row's votes into bits so counting them is one table lookup per 8 models
+    packed = np.packbits(pred_matrix != 0, axis=1)
+    votes = POPCOUNT8[packed].sum(axis=1, dtype=np.int32)
+    consensus = (votes * 2 > n_models).astype(np.int8)
+    # Accumulate in float64 so the reported confidence does not depend on the input dtype
+    avg_conf = prob_matrix.mean(axis=1, dtype=np.float64)
+    # Unanimous when every model voted the same way
+    agreement = (votes == 0) | (votes == n_models)
+    return consensus, avg_conf, agreement
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the inference thread pool so async handlers never stall the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app.state.executor, partial(func, *args, **kwargs))
+
+MAX_UPLOAD_SIZE = 1024 * 1024 * 1024  # 1GB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+def save_upload_to_tempfile(file: UploadFile) -> str:
+    """Stream an uploaded file to a temporary CSV on disk, enforcing the size limit"""
+    file_size = 0
+    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.csv')
+    try:
+        with tmp_file:
+            for chunk in iter(lambda: file.file.read(UPLOAD_CHUNK_SIZE), b""):
+                file_size += len(chunk)
+                if file_size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(status_code=413, detail="File too large. Maximum size is 1GB")
+                tmp_file.write(chunk)
+    except BaseException:
+        os.unlink(tmp_file.name)
+        raise
+    return tmp_file.name
+
 @app.get("/")
 def root():
     return {"message": "Cancer Classification API v2.0", "status": "running"}
@@ -40,21 +121,22 @@ def health_check():
     return {"status": "healthy", "version": "2.0.0"}
 
 @app.get("/datasets")
-def get_datasets():
+def get_datasets(service=Depends(svc)):
     """Get information about available datasets"""
-    service = get_model_service()
     return service.get_dataset_info()
 
 @app.get("/metrics")
-def metrics(dataset: str | None = None) -> Dict[str, Any]:
-    service = get_model_service()
-    return service.get_model_metrics(dataset)
+def metrics(dataset: str | None = None, service=Depends(svc)) -> ORJSONResponse:
+    return ORJSONResponse(service.get_model_metrics(dataset))
 
 @app.post("/predict")
-def predict(payload: PredictInput) -> Dict[str, Any]:
-    service = get_model_service()
+async def predict(payload: PredictInput, service=Depends(svc)) -> Dict[str, Any]:
+    # Reject NaN/inf features up front, before any model runs
+    if not all(math.isfinite(v) for v in payload.features.values()):
+        raise HTTPException(status_code=400, detail="non-finite features")
+
     try:
-        preds = service.predict_single(payload.dataset, payload.features)
+        preds = await run_blocking(service.predict_single, payload.dataset, payload.features)
         # normalize to array of models
         predictions = []
         for model_name, result in preds.items():
@@ -65,84 +147,62 @@ def predict(payload: PredictInput) -> Dict[str, Any]:
                 "label": str(result.get("label", "")),
             })
 
-        # consensus (simple majority and avg confidence)
-        malignant_votes = sum(1 for p in predictions if p["prediction"] == 1)
-        consensus_pred = 1 if malignant_votes > (len(predictions) / 2.0) else 0
-        avg_conf = sum(p["probability"] for p in predictions) / max(len(predictions), 1)
-        agreement = all(p["prediction"] == consensus_pred for p in predictions) if predictions else False
+        # consensus (simple majority and avg confidence) as a single-row reduction
+        pred_matrix = np.array([[p["prediction"] for p in predictions]], dtype=np.int8)
+        prob_matrix = np.array([[p["probability"] for p in predictions]], dtype=np.float64)
+        consensus, avg_conf, agreement = compute_consensus(pred_matrix, prob_matrix)
 
         return {
             "dataset": payload.dataset,
             "predictions": predictions,
             "consensus": {
-                "prediction": consensus_pred,
-                "confidence": avg_conf,
-                "agreement": agreement,
+                "prediction": int(consensus[0]),
+                "confidence": float(avg_conf[0]),
+                "agreement": bool(agreement[0]),
             },
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/predict/batch")
-def predict_batch(dataset: str = Form(...), file: UploadFile = File(...)) -> Dict[str, Any]:
+async def predict_batch(dataset: str = Form(...), file: UploadFile = File(...), service=Depends(svc)) -> ORJSONResponse:
     """Process CSV file for batch predictions - supports up to 1GB files"""
-    service = get_model_service()
     
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
-    # Check file size (1GB limit)
-    file_size = 0
-    content = b""
-    for chunk in file.file:
-        file_size += len(chunk)
-        if file_size > 1024 * 1024 * 1024:  # 1GB
-            raise HTTPException(status_code=413, detail="File too large. Maximum size is 1GB")
-        content += chunk
-    
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp_file:
-        tmp_file.write(content)
-        tmp_file_path = tmp_file.name
+    # Stream upload to a temporary file (1GB limit)
+    tmp_file_path = await run_blocking(save_upload_to_tempfile, file)
     
     try:
-        result = service.predict_csv_batch(dataset, tmp_file_path)
-        return result
+        result = await run_blocking(service.predict_csv_batch, dataset, tmp_file_path)
+        return ORJSONResponse(result)
     finally:
         # Clean up temporary file
         os.unlink(tmp_file_path)
 
 @app.post("/analyze-csv")
-def analyze_csv(file: UploadFile = File(...)) -> Dict[str, Any]:
+async def analyze_csv(file: UploadFile = File(...), service=Depends(svc)) -> ORJSONResponse:
     """Analyze uploaded CSV and suggest compatible datasets - supports up to 1GB files"""
-    service = get_model_service()
     
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
-    # Check file size (1GB limit)
-    file_size = 0
-    content = b""
-    for chunk in file.file:
-        file_size += len(chunk)
-        if file_size > 1024 * 1024 * 1024:  # 1GB
-            raise HTTPException(status_code=413, detail="File too large. Maximum size is 1GB")
-        content += chunk
-    
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp_file:
-        tmp_file.write(content)
-        tmp_file_path = tmp_file.name
+    # Stream upload to a temporary file (1GB limit)
+    tmp_file_path = await run_blocking(save_upload_to_tempfile, file)
     
     try:
-        result = service.compare_csv_with_datasets(tmp_file_path)
-        return result
+        result = await run_blocking(service.compare_csv_with_datasets, tmp_file_path)
+        return ORJSONResponse(result)
     finally:
         # Clean up temporary file
         os.unlink(tmp_file_path)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker runs the lifespan and loads its own copy of every model (no shared-memory
+    # loader exists), so stay single-process unless API_WORKERS asks for more.
+    # The import string lets uvicorn spawn workers from python/.
+    uvicorn.run("api:app", host="0.0.0.0", port=8000, workers=api_workers())
 
 
@@ -4,67 +4,96 @@ Cancer Classification Model Training Script
 Migrated from Colab notebooks to Replit environment
 """
 
+import os
+
+# Cap native thread pools before numpy/xgboost load them; small datasets slow down when
+# every hyperthread is used
+N_JOBS = min(4, os.cpu_count() or 1)
+os.environ.setdefault('OMP_NUM_THREADS', str(N_JOBS))
+
 import pandas as pd
 import numpy as np
 from sklearn.datasets import load_breast_cancer, load_wine, load_digits
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import StratifiedShuffleSplit, cross_val_score
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.svm import SVC
 from xgboost import XGBClassifier
-from sklearn.metrics import accuracy_score, precision_score, roc_auc_score, cohen_kappa_score
+from sklearn.metrics import roc_auc_score
 import joblib
-import os
+from joblib import Parallel, delayed
 
 def create_synthetic_gastric_data():
     """Create synthetic gastric cancer dataset for demonstration"""
-    np.random.seed(42)
+    rng = np.random.default_rng(42)
     n_samples = 500
     n_features = 20
     
     # Generate features
-    X = np.random.randn(n_samples, n_features)
+    X = rng.standard_normal((n_samples, n_features))
     # Add some correlation structure
-    X[:, 1] = X[:, 0] + 0.5 * np.random.randn(n_samples)
-    X[:, 2] = X[:, 0] - 0.3 * X[:, 1] + 0.4 * np.random.randn(n_samples)
+    X[:, 1] = X[:, 0] + 0.5 * rng.standard_normal(n_samples)
+    X[:, 2] = X[:, 0] - 0.3 * X[:, 1] + 0.4 * rng.standard_normal(n_samples)
     
     # Generate labels with some pattern
-    y = (X[:, 0] + 0.5 * X[:, 1] - 0.3 * X[:, 2] + np.random.randn(n_samples) * 0.5 > 0).astype(int)
+    y = (X[:, 0] + 0.5 * X[:, 1] - 0.3 * X[:, 2] + rng.standard_normal(n_samples) * 0.5 > 0).astype(int)
     
     return X, y
 
 def create_synthetic_lung_data():
     """Create synthetic lung cancer dataset for demonstration"""
-    np.random.seed(123)
+    rng = np.random.default_rng(123)
     n_samples = 600
     n_features = 18
     
     # Generate features
-    X = np.random.randn(n_samples, n_features)
-    # Add some correlation structure
-    for i in range(1, n_features):
-        X[:, i] = 0.3 * X[:, 0] + 0.7 * np.random.randn(n_samples)
+    X = rng.standard_normal((n_samples, n_features))
+    # Add some correlation structure: every other feature leans on feature 0
+    X[:, 1:] = 0.3 * X[:, [0]] + 0.7 * rng.standard_normal((n_samples, n_features - 1))
     
     # Generate labels
-    y = (2 * X[:, 0] + X[:, 1] - X[:, 2] + np.random.randn(n_samples) * 0.7 > 0).astype(int)
+    y = (2 * X[:, 0] + X[:, 1] - X[:, 2] + rng.standard_normal(n_samples) * 0.7 > 0).astype(int)
     
     return X, y
 
-def train_ensemble_model(X_train, X_test, y_train, y_test, base_model, meta_model, model_name):
-    """Train ensemble model with XGBoost as base and specified meta-learner"""
-    
-    # Train XGBoost base model
-    xgb_model = XGBClassifier(random_state=42, eval_metric='logloss')
-    xgb_model.fit(X_train, y_train)
-    
-    # Get XGBoost predictions as features for meta-learner
-    xgb_train_pred = xgb_model.predict_proba(X_train)[:, 1].reshape(-1, 1)
-    xgb_test_pred = xgb_model.predict_proba(X_test)[:, 1].reshape(-1, 1)
-    
-    # Combine original features with XGBoost predictions
-    meta_train_features = np.hstack([X_train, xgb_train_pred])
-    meta_test_features = np.hstack([X_test, xgb_test_pred])
+def build_meta_features(X_scaled, xgb_pred):
+    """Write scaled features and the XGBoost probability column into one float32 column-major matrix"""
+    n_samples, n_features = X_scaled.shape
+    meta_features = np.empty((n_samples, n_features + 1), dtype=np.float32, order='F')
+    meta_features[:, :n_features] = X_scaled
+    meta_features[:, n_features] = xgb_pred
+    return meta_features
+
+def binary_classification_metrics(y_true, y_pred, y_pred_proba):
+    """Accuracy, weighted precision and kappa from one 2x2 confusion matrix, plus ROC AUC"""
+    y_true = np.asarray(y_true, dtype=np.intp)
+    y_pred = np.asarray(y_pred, dtype=np.intp)
+    
+    # Rows are true labels, columns are predicted labels
+    cm = np.bincount(y_true * 2 + y_pred, minlength=4).reshape(2, 2)
+    n = cm.sum()
+    correct = np.diag(cm)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    
+    accuracy = correct.sum() / n
+    # Classes that are never predicted get precision 0, as in precision_score
+    class_precision = np.divide(correct, predicted, out=np.zeros(2), where=predicted > 0)
+    precision = (class_precision * support).sum() / n
+    expected_agreement = (support * predicted).sum() / n ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kappa = (accuracy - expected_agreement) / (1 - expected_agreement)
+    
+    return {
+        'accuracy': float(accuracy),
+        'precision': float(precision),
+        'auc': float(roc_auc_score(y_true, y_pred_proba)),
+        'kappa': float(kappa)
+    }
+
+def train_meta_only(meta_model, meta_train_features, meta_test_features, y_train, y_test):
+    """Fit a meta-learner on the stacked features and score it on the test split"""
     
     # Train meta-learner
     meta_model.fit(meta_train_features, y_train)
@@ -74,68 +103,107 @@ def train_ensemble_model(X_train, X_test, y_train, y_test, base_model, meta_mode
     y_pred_proba = meta_model.predict_proba(meta_test_features)[:, 1]
     
     # Calculate metrics
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred, average='weighted')
-    auc = roc_auc_score(y_test, y_pred_proba)
-    kappa = cohen_kappa_score(y_test, y_pred)
+    metrics = binary_classification_metrics(y_test, y_pred, y_pred_proba)
     
+    return meta_model, metrics
+
+def print_metrics(model_name, metrics):
+    """Print the test metrics of one ensemble"""
     print(f"{model_name} Metrics:")
-    print(f"  Accuracy: {accuracy:.4f}")
-    print(f"  Precision: {precision:.4f}")
-    print(f"  AUC: {auc:.4f}")
-    print(f"  Kappa: {kappa:.4f}")
+    print(f"  Accuracy: {metrics['accuracy']:.4f}")
+    print(f"  Precision: {metrics['precision']:.4f}")
+    print(f"  AUC: {metrics['auc']:.4f}")
+    print(f"  Kappa: {metrics['kappa']:.4f}")
     print()
+
+def split_and_scale(X, y, cols=None):
+    """Stratified 80/20 split of X (optionally restricted to cols), standardized on the training split"""
+    
+    # Split data as stratified row indices
+    splitter = StratifiedShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
+    (train_rows, test_rows), = splitter.split(np.zeros(len(y)), y)
+    y_train, y_test = y[train_rows], y[test_rows]
+    
+    # Gather each split once, then scale in place
+    if cols is None:
+        X_train_scaled = np.take(X, train_rows, axis=0)
+        X_test_scaled = np.take(X, test_rows, axis=0)
+    else:
+        X_train_scaled = X[np.ix_(train_rows, cols)]
+        X_test_scaled = X[np.ix_(test_rows, cols)]
+    scaler = StandardScaler().fit(X_train_scaled)
+    for X_split in (X_train_scaled, X_test_scaled):
+        X_split -= scaler.mean_
+        X_split /= scaler.scale_
+    
+    return X_train_scaled, X_test_scaled, y_train, y_test, scaler
+
+def fit_and_save_ensembles(X_train_scaled, X_test_scaled, y_train, y_test, scaler, dataset_name,
+                           xgb_model, meta_models, extra_artifacts=None):
+    """Fit the XGBoost base model and each (model_type, meta_model, model_name) stacked on it, then save every ensemble"""
     
-    # Create ensemble model for saving
-    ensemble_model = {
-        'xgb_model': xgb_model,
-        'meta_model': meta_model,
-        'scaler': StandardScaler().fit(X_train),
-        'metrics': {
-            'accuracy': accuracy,
-            'precision': precision,
-            'auc': auc,
-            'kappa': kappa
-        }
-    }
+    # Create output directory
+    os.makedirs('models', exist_ok=True)
     
-    return ensemble_model
+    xgb_model.fit(X_train_scaled, y_train)
+    
+    # Get XGBoost predictions as features for meta-learner; inplace_predict returns the
+    # positive-class probability as 1-D float32 without building a DMatrix or an (n, 2) array
+    booster = xgb_model.get_booster()
+    xgb_train_pred = booster.inplace_predict(X_train_scaled, predict_type='value')
+    xgb_test_pred = booster.inplace_predict(X_test_scaled, predict_type='value')
+    
+    # Combine original features with XGBoost predictions (allocated once, shared by all meta-learners)
+    meta_train_features = build_meta_features(X_train_scaled, xgb_train_pred)
+    meta_test_features = build_meta_features(X_test_scaled, xgb_test_pred)
+    
+    # Fit the meta-learners in parallel worker processes; each uses one thread so they don't oversubscribe
+    jobs = [delayed(train_meta_only)(meta_model, meta_train_features, meta_test_features, y_train, y_test)
+            for _, meta_model, _ in meta_models]
+    results = Parallel(n_jobs=min(len(jobs), N_JOBS), backend='loky')(jobs)
+    
+    # Serialize the base booster once as UBJ instead of pickling the sklearn wrapper into each ensemble
+    booster_ubj = bytes(booster.save_raw('ubj'))
+    xgb_params = xgb_model.get_params()
+    
+    for (model_type, _, model_name), (meta_model, metrics) in zip(meta_models, results):
+        print_metrics(model_name, metrics)
+        
+        # Create ensemble model for saving
+        ensemble_model = {
+            # Restore with b = xgboost.Booster(); b.load_model(bytearray(booster_ubj))
+            'booster_ubj': booster_ubj,
+            'xgb_params': xgb_params,
+            'meta_model': meta_model,
+            'scaler': scaler,  # fit once on the raw training split
+            'metrics': metrics,
+            **(extra_artifacts or {}),
+        }
+        # lz4-compressed artifacts are smaller but cannot be opened with joblib.load(..., mmap_mode='r')
+        joblib.dump(ensemble_model, f'models/{dataset_name}_cancer_{model_type}.pkl',
+                    compress=('lz4', 3), protocol=5)
 
 def train_models_for_dataset(X, y, dataset_name):
     """Train all three ensemble models for a given dataset"""
     
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-    
-    # Scale features
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
+    # Split and scale data
+    X_train_scaled, X_test_scaled, y_train, y_test, scaler = split_and_scale(X, y)
     
     print(f"\nTraining models for {dataset_name} cancer dataset...")
-    print(f"Training samples: {len(X_train)}, Test samples: {len(X_test)}")
+    print(f"Training samples: {len(y_train)}, Test samples: {len(y_test)}")
     print(f"Features: {X.shape[1]}")
     
-    # Create output directory
-    os.makedirs('models', exist_ok=True)
+    # Train XGBoost base model once; all three meta-learners stack on its predictions
+    xgb_model = XGBClassifier(tree_method='hist', max_bin=256, random_state=42, eval_metric='logloss', n_jobs=N_JOBS)
+    
+    meta_models = [
+        ('xgb_svm', SVC(probability=True, random_state=42), "XGB + SVM"),
+        ('xgb_lr', LogisticRegression(random_state=42, max_iter=1000), "XGB + LR"),
+        ('xgb_rf', RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=1), "XGB + RF"),
+    ]
     
-    # Train XGBoost + SVM
-    svm_model = SVC(probability=True, random_state=42)
-    xgb_svm = train_ensemble_model(X_train_scaled, X_test_scaled, y_train, y_test, 
-                                   XGBClassifier, svm_model, "XGB + SVM")
-    joblib.dump(xgb_svm, f'models/{dataset_name}_cancer_xgb_svm.pkl')
-    
-    # Train XGBoost + Logistic Regression
-    lr_model = LogisticRegression(random_state=42, max_iter=1000)
-    xgb_lr = train_ensemble_model(X_train_scaled, X_test_scaled, y_train, y_test,
-                                  XGBClassifier, lr_model, "XGB + LR")
-    joblib.dump(xgb_lr, f'models/{dataset_name}_cancer_xgb_lr.pkl')
-    
-    # Train XGBoost + Random Forest
-    rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
-    xgb_rf = train_ensemble_model(X_train_scaled, X_test_scaled, y_train, y_test,
-                                  XGBClassifier, rf_model, "XGB + RF")
-    joblib.dump(xgb_rf, f'models/{dataset_name}_cancer_xgb_rf.pkl')
+    fit_and_save_ensembles(X_train_scaled, X_test_scaled, y_train, y_test, scaler, dataset_name,
+                           xgb_model, meta_models)
 
 def main():
     """Main training function"""
@@ -4,209 +4,194 @@ Gene Expression Cancer Classification Model Training Script
 Based on the gastric and lung cancer notebooks
 """
 
-import pandas as pd
+import os
+
+# Imported first: model_trainer caps OMP_NUM_THREADS before numpy/xgboost load
+from model_trainer import N_JOBS, split_and_scale, fit_and_save_ensembles
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.preprocessing import LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
-from sklearn.svm import SVC
+from sklearn.svm import LinearSVC
+from sklearn.calibration import CalibratedClassifierCV
 from xgboost import XGBClassifier
-from sklearn.metrics import accuracy_score, precision_score, roc_auc_score, cohen_kappa_score
-from sklearn.feature_selection import SelectKBest, f_classif
-import joblib
-import os
 import warnings
 warnings.filterwarnings('ignore')
 
-def create_gastric_cancer_data():
-    """Create gastric cancer dataset based on the notebook structure"""
-    print("Creating gastric cancer dataset...")
-    
-    # Create synthetic gastric cancer gene expression data
-    np.random.seed(42)
-    n_samples = 500
-    n_genes = 2000  # Reduced from 31k+ for practical purposes
+# On-disk cache for the synthetic expression matrices; bump the version when generation changes
+DATA_CACHE_DIR = os.path.join('models', '_cache')
+DATA_CACHE_VERSION = 2
+
+def load_cached_dataset(name, n_samples, n_genes, generate):
+    """Load a synthetic (X, y) pair from the on-disk cache, generating and saving it on first use"""
+    stem = os.path.join(DATA_CACHE_DIR, f"{name}_v{DATA_CACHE_VERSION}_{n_samples}x{n_genes}")
+    X_path, y_path = f"{stem}_X.npy", f"{stem}_y.npy"
+    
+    if os.path.exists(X_path) and os.path.exists(y_path):
+        print(f"Loaded cached {name} dataset from {DATA_CACHE_DIR}")
+        return np.load(X_path, mmap_mode='r'), np.load(y_path)
+    
+    X, y = generate(n_samples, n_genes)
+    os.makedirs(DATA_CACHE_DIR, exist_ok=True)
+    np.save(X_path, X)
+    np.save(y_path, y)
+    return X, y
+
+def generate_gastric_expression(n_samples, n_genes):
+    """Generate synthetic gastric cancer gene expression data and labels"""
+    rng = np.random.default_rng(42)
     
-    # Generate gene expression data
-    X = np.random.exponential(2, (n_samples, n_genes))
+    # Generate gene expression data as float32 in column-major order:
+    # drawing (genes, samples) and transposing gives a Fortran-ordered view without a copy
+    X = (rng.standard_exponential((n_genes, n_samples), dtype=np.float32) * 2.0).T
     
     # Add some structure to make it more realistic
     # Some genes are more important for classification
-    important_genes = np.random.choice(n_genes, size=50, replace=False)
-    for i, gene_idx in enumerate(important_genes):
-        X[:, gene_idx] += np.random.normal(0, 1, n_samples) * (i % 3 + 1)
+    important_genes = rng.choice(n_genes, size=50, replace=False)
+    noise = rng.standard_normal((n_samples, len(important_genes)), dtype=np.float32)
+    X[:, important_genes] += noise * (np.arange(len(important_genes), dtype=np.float32) % 3 + 1)
     
     # Create labels (0: Normal, 1: Cancer)
     # Use a combination of important genes to determine labels
     cancer_score = np.sum(X[:, important_genes[:20]], axis=1)
     y = (cancer_score > np.percentile(cancer_score, 60)).astype(int)
     
+    return X, y
+
+def create_gastric_cancer_data():
+    """Create gastric cancer dataset based on the notebook structure"""
+    print("Creating gastric cancer dataset...")
+    
+    # Create synthetic gastric cancer gene expression data
+    n_samples = 500
+    n_genes = 2000  # Reduced from 31k+ for practical purposes
+    X, y = load_cached_dataset('gastric', n_samples, n_genes, generate_gastric_expression)
+    
     # Create gene names
     gene_names = [f"GENE_{i:04d}" for i in range(n_genes)]
     
-    # Create DataFrame
-    df = pd.DataFrame(X, columns=gene_names)
-    df['Sample_Characteristics'] = ['Normal' if label == 0 else 'Cancer' for label in y]
-    
     print(f"Gastric dataset created: {n_samples} samples, {n_genes} genes")
     print(f"Class distribution: {np.bincount(y)}")
     
-    return df
+    # 0: Normal, 1: Cancer
+    return X, y.astype(np.int8), gene_names
 
-def create_lung_cancer_data():
-    """Create lung cancer dataset based on the notebook structure"""
-    print("Creating lung cancer dataset...")
+def generate_lung_expression(n_samples, n_genes):
+    """Generate synthetic lung cancer gene expression data and labels"""
+    rng = np.random.default_rng(123)
     
-    # Create synthetic lung cancer gene expression data
-    np.random.seed(123)
-    n_samples = 600
-    n_genes = 2000  # Reduced from 31k+ for practical purposes
-    
-    # Generate gene expression data
-    X = np.random.exponential(1.5, (n_samples, n_genes))
+    # Generate gene expression data (float32, column-major)
+    X = (rng.standard_exponential((n_genes, n_samples), dtype=np.float32) * 1.5).T
     
     # Add some structure to make it more realistic
-    important_genes = np.random.choice(n_genes, size=60, replace=False)
-    for i, gene_idx in enumerate(important_genes):
-        X[:, gene_idx] += np.random.normal(0, 1.2, n_samples) * (i % 4 + 1)
+    important_genes = rng.choice(n_genes, size=60, replace=False)
+    noise = rng.standard_normal((n_samples, len(important_genes)), dtype=np.float32) * 1.2
+    X[:, important_genes] += noise * (np.arange(len(important_genes), dtype=np.float32) % 4 + 1)
     
     # Create labels (0: Normal, 1: Cancer)
     cancer_score = np.sum(X[:, important_genes[:25]], axis=1)
     y = (cancer_score > np.percentile(cancer_score, 55)).astype(int)
     
+    return X, y
+
+def create_lung_cancer_data():
+    """Create lung cancer dataset based on the notebook structure"""
+    print("Creating lung cancer dataset...")
+    
+    # Create synthetic lung cancer gene expression data
+    n_samples = 600
+    n_genes = 2000  # Reduced from 31k+ for practical purposes
+    X, y = load_cached_dataset('lung', n_samples, n_genes, generate_lung_expression)
+    
     # Create gene names
     gene_names = [f"GENE_{i:04d}" for i in range(n_genes)]
     
-    # Create DataFrame
-    df = pd.DataFrame(X, columns=gene_names)
-    df['classes'] = ['Normal' if label == 0 else 'Cancer' for label in y]
-    
     print(f"Lung dataset created: {n_samples} samples, {n_genes} genes")
     print(f"Class distribution: {np.bincount(y)}")
     
-    return df
+    # 0: Normal, 1: Cancer
+    return X, y.astype(np.int8), gene_names
 
-def preprocess_gene_expression_data(df, target_column, n_features=1000):
-    """Preprocess gene expression data and select top features"""
-    
-    # Separate features and target
-    X = df.drop(columns=[target_column])
-    y = df[target_column]
+def fast_f_classif_binary(X, y):
+    """ANOVA F-statistic for every column against a binary target (closed form of f_classif)"""
+    mask = y.astype(bool)
+    n = len(y)
+    n1 = int(mask.sum())
+    n0 = n - n1
+    
+    X0 = X[~mask]
+    X1 = X[mask]
+    m0 = X0.mean(axis=0, dtype=np.float64)
+    m1 = X1.mean(axis=0, dtype=np.float64)
+    grand_mean = (n0 * m0 + n1 * m1) / n
+    
+    between = n0 * (m0 - grand_mean) ** 2 + n1 * (m1 - grand_mean) ** 2
+    within = ((X0 - m0) ** 2).sum(axis=0) + ((X1 - m1) ** 2).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return between / (within / (n - 2))
+
+def preprocess_gene_expression_data(X, y, gene_names, n_features=1000):
+    """Encode targets and pick the top feature columns; returns column indices rather than a copied matrix"""
     
-    # Encode target variable
+    # Target is already integer-coded at creation time; the encoder only maps codes back to names
+    y_encoded = np.asarray(y, dtype=np.int8)
     le = LabelEncoder()
-    y_encoded = le.fit_transform(y)
+    le.classes_ = np.array(['Normal', 'Cancer'])
     
     print(f"Original features: {X.shape[1]}")
     
-    # Feature selection - select top N features
+    # Feature selection - select top N features by F-score, kept in original column order
     if X.shape[1] > n_features:
-        selector = SelectKBest(score_func=f_classif, k=n_features)
-        X_selected = selector.fit_transform(X, y_encoded)
-        selected_features = X.columns[selector.get_support()].tolist()
+        scores = fast_f_classif_binary(X, y_encoded)
+        # argpartition picks the top k in O(d); a boolean mask restores column order without sorting
+        top_mask = np.zeros(len(scores), dtype=bool)
+        top_mask[np.argpartition(-scores, n_features)[:n_features]] = True
+        top_idx = np.flatnonzero(top_mask)
+        selected_features = [gene_names[i] for i in top_idx]
         print(f"Selected top {n_features} features")
     else:
-        X_selected = X.values
-        selected_features = X.columns.tolist()
+        top_idx = np.arange(X.shape[1])
+        selected_features = list(gene_names)
         print(f"Using all {X.shape[1]} features")
     
-    return X_selected, y_encoded, selected_features, le
+    return top_idx, y_encoded, selected_features, le
 
-def train_ensemble_model(X_train, X_test, y_train, y_test, base_model, meta_model, model_name):
-    """Train ensemble model with XGBoost as base and specified meta-learner"""
+def train_models_for_dataset(data, dataset_name, n_features=1000):
+    """Train all three ensemble models for a given (X, y, gene_names) gene expression dataset"""
+    
+    # Preprocess data
+    X, y, gene_names = data
+    selected_cols, y, selected_features, label_encoder = preprocess_gene_expression_data(X, y, gene_names, n_features)
+    
+    # Split and scale only the selected columns; the full matrix is never copied
+    X_train_scaled, X_test_scaled, y_train, y_test, scaler = split_and_scale(X, y, selected_cols)
+    
+    print(f"\nTraining models for {dataset_name} cancer dataset...")
+    print(f"Training samples: {len(y_train)}, Test samples: {len(y_test)}")
+    print(f"Features: {len(selected_cols)}")
     
-    # Train XGBoost base model
+    # Train XGBoost base model once; all three meta-learners stack on its predictions
     xgb_model = XGBClassifier(
         n_estimators=100,
         learning_rate=0.1,
         max_depth=6,
+        tree_method='hist',
+        max_bin=256,
         random_state=42,
-        eval_metric='logloss'
+        eval_metric='logloss',
+        n_jobs=N_JOBS
     )
-    xgb_model.fit(X_train, y_train)
-    
-    # Get XGBoost predictions as features for meta-learner
-    xgb_train_pred = xgb_model.predict_proba(X_train)[:, 1].reshape(-1, 1)
-    xgb_test_pred = xgb_model.predict_proba(X_test)[:, 1].reshape(-1, 1)
-    
-    # Combine original features with XGBoost predictions
-    meta_train_features = np.hstack([X_train, xgb_train_pred])
-    meta_test_features = np.hstack([X_test, xgb_test_pred])
-    
-    # Train meta-learner
-    meta_model.fit(meta_train_features, y_train)
-    
-    # Make final predictions
-    y_pred = meta_model.predict(meta_test_features)
-    y_pred_proba = meta_model.predict_proba(meta_test_features)[:, 1]
-    
-    # Calculate metrics
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred, average='weighted')
-    auc = roc_auc_score(y_test, y_pred_proba)
-    kappa = cohen_kappa_score(y_test, y_pred)
-    
-    print(f"{model_name} Metrics:")
-    print(f"  Accuracy: {accuracy:.4f}")
-    print(f"  Precision: {precision:.4f}")
-    print(f"  AUC: {auc:.4f}")
-    print(f"  Kappa: {kappa:.4f}")
-    print()
-    
-    # Create ensemble model for saving
-    ensemble_model = {
-        'xgb_model': xgb_model,
-        'meta_model': meta_model,
-        'scaler': StandardScaler().fit(X_train),
-        'metrics': {
-            'accuracy': accuracy,
-            'precision': precision,
-            'auc': auc,
-            'kappa': kappa
-        }
-    }
-    
-    return ensemble_model
-
-def train_models_for_dataset(df, dataset_name, target_column, n_features=1000):
-    """Train all three ensemble models for a given gene expression dataset"""
-    
-    # Preprocess data
-    X, y, selected_features, label_encoder = preprocess_gene_expression_data(df, target_column, n_features)
-    
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
     
-    # Scale features
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
+    meta_models = [
+        # Linear SVM with sigmoid calibration for predict_proba; kernel SVC scales poorly on 1000+ features
+        ('xgb_svm', CalibratedClassifierCV(LinearSVC(C=1.0, dual='auto', random_state=42), cv=3, method='sigmoid'),
+         "XGB + SVM"),
+        ('xgb_lr', LogisticRegression(random_state=42, max_iter=1000), "XGB + LR"),
+        ('xgb_rf', RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=1), "XGB + RF"),
+    ]
     
-    print(f"\nTraining models for {dataset_name} cancer dataset...")
-    print(f"Training samples: {len(X_train)}, Test samples: {len(X_test)}")
-    print(f"Features: {X.shape[1]}")
-    
-    # Create output directory
-    os.makedirs('models', exist_ok=True)
-    
-    # Train XGBoost + SVM
-    svm_model = SVC(probability=True, random_state=42)
-    xgb_svm = train_ensemble_model(X_train_scaled, X_test_scaled, y_train, y_test, 
-                                   XGBClassifier, svm_model, "XGB + SVM")
-    joblib.dump(xgb_svm, f'models/{dataset_name}_cancer_xgb_svm.pkl')
-    
-    # Train XGBoost + Logistic Regression
-    lr_model = LogisticRegression(random_state=42, max_iter=1000)
-    xgb_lr = train_ensemble_model(X_train_scaled, X_test_scaled, y_train, y_test,
-                                  XGBClassifier, lr_model, "XGB + LR")
-    joblib.dump(xgb_lr, f'models/{dataset_name}_cancer_xgb_lr.pkl')
-    
-    # Train XGBoost + Random Forest
-    rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
-    xgb_rf = train_ensemble_model(X_train_scaled, X_test_scaled, y_train, y_test,
-                                  XGBClassifier, rf_model, "XGB + RF")
-    joblib.dump(xgb_rf, f'models/{dataset_name}_cancer_xgb_rf.pkl')
+    fit_and_save_ensembles(X_train_scaled, X_test_scaled, y_train, y_test, scaler, dataset_name,
+                           xgb_model, meta_models, extra_artifacts={'feature_names': selected_features})
 
 def main():
     """Main training function"""
@@ -214,12 +199,12 @@ def main():
     print("=" * 60)
     
     # Create gastric cancer dataset
-    gastric_df = create_gastric_cancer_data()
-    train_models_for_dataset(gastric_df, 'gastric', 'Sample_Characteristics', n_features=1000)
+    gastric_data = create_gastric_cancer_data()
+    train_models_for_dataset(gastric_data, 'gastric', n_features=1000)
     
     # Create lung cancer dataset
-    lung_df = create_lung_cancer_data()
-    train_models_for_dataset(lung_df, 'lung', 'classes', n_features=1000)
+    lung_data = create_lung_cancer_data()
+    train_models_for_dataset(lung_data, 'lung', n_features=1000)
     
     print("\nModel training completed!")
     print("Saved models:")
@@ -0,0 +1,53 @@
+"""
+Tests for the prediction API, run against a stub model service
+"""
+
+import os
+import sys
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubModelService:
+    """Minimal stand-in for CancerModelService"""
+
+    def predict_single(self, dataset, features):
+        return {
+            "xgb_svm": {"prediction": 1, "probability": 0.6, "label": "Malignant"},
+            "xgb_lr": {"prediction": 1, "probability": 0.7, "label": "Malignant"},
+            "xgb_rf": {"prediction": 0, "probability": 0.3, "label": "Benign"},
+        }
+
+
+stub_module = types.ModuleType("model_service")
+stub_module.get_model_service = StubModelService
+sys.modules["model_service"] = stub_module
+
+import api  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    with TestClient(api.app) as test_client:
+        yield test_client
+
+
+def test_predict_returns_consensus(client):
+    response = client.post("/predict", json={"dataset": "breast", "features": {"feature_1": 14.1}})
+    assert response.status_code == 200
+    consensus = response.json()["consensus"]
+    assert consensus["prediction"] == 1
+    assert consensus["confidence"] == pytest.approx((0.6 + 0.7 + 0.3) / 3)
+    assert consensus["agreement"] is False
+
+
+@pytest.mark.parametrize("value", ["NaN", "Infinity", "-Infinity"])
+def test_predict_rejects_non_finite_features(client, value):
+    body = '{"dataset": "breast", "features": {"feature_1": %s}}' % value
+    response = client.post("/predict", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "non-finite features"